@@ -0,0 +1,248 @@
+"""
+Structured appropriation extraction from StealthOCR text to CSV
+
+Each document is tokenized in a single pass: every line is classified
+once by a precompiled, anchored pattern and fed to a small state machine,
+so the cost is linear in the length of the text. Rows are yielded as soon
+as they are complete and can be streamed straight to a CSV writer.
+
+The 'appropriation code' and 'appropriation activity' columns are kept for
+compatibility with the browser export but are always empty: DD 1415 pages
+carry neither a Treasury appropriation code nor an activity separate from
+the budget activity, so there is nothing in the text to fill them from.
+"""
+
+import re
+import csv
+import sys
+import os
+
+CSV_COLUMNS = [
+    'appropriation_category',
+    'appropriation code',
+    'appropriation activity',
+    'branch',
+    'fiscal_year_start',
+    'fiscal_year_end',
+    'budget_activity_number',
+    'budget_activity_title',
+    'pem',
+    'budget_title',
+    'program_base_congressional',
+    'program_base_dod',
+    'reprogramming_amount',
+    'revised_program_total',
+    'explanation',
+    'file'
+]
+
+BRANCHES = r'Army|Navy|Marine\ Corps|Air\ Force|Space\ Force|Defense-\s*Wide'
+
+# One alternative per line kind; the outer group name is the token kind
+LINE_RE = re.compile(r'''
+    (?P<page>===\s*PAGE\s+\d+\s*===)
+  | (?P<section>FY\s*\d{4}\s+REPROGRAMMING\b.*)
+  | (?P<header>(?P<header_branch>ARMY|NAVY|MARINE\ CORPS|AIR\ FORCE|SPACE\ FORCE|DEFENSE-\s*WIDE)
+               \s+(?:INCREASE|DECREASE)\b.*)
+  | (?P<appropriation>(?P<category>[A-Za-z][A-Za-z ,&-]*?),\s*(?P<branch>''' + BRANCHES + r'''),\s*
+                      (?P<fy_start>\d{2})/(?P<fy_end>\d{2})\b.*)
+  | (?P<activity>Budget\s+Activity\s+(?P<activity_number>\d+)\s*:\s*(?P<activity_title>.*))
+  | (?P<amounts>(?:(?P<base_congressional>[\d,]+)\s+(?P<base_dod>[\d,]+)\s+)?
+                (?P<reprogramming>[+-]?[\d,]+)\s+(?P<revised>[\d,]+))
+  | (?P<number>[+-]?[\d,.]+)
+  | (?P<explanation>Explanation\s*:\s*(?P<explanation_text>.*))
+  | (?P<stop>(?:DD\s*1415|Approved\b|UNCLASSIFIED\b|Unclassified\b).*)
+  | (?P<blank>\s*)
+  | (?P<text>.+)
+''', re.VERBOSE)
+
+# Page furniture around a page break: the DD 1415 footer, and the running
+# header of the next page, from its first line to the column headings
+PAGE_FOOTER_RE = re.compile(r'DD\s*1415\b')
+RUNNING_HEADER_START_RE = re.compile(r'Unclassified\s+REPROGRAMMING\s+ACTION\b', re.IGNORECASE)
+RUNNING_HEADER_END_RE = re.compile(r'Approved\s+by\s+Sec\s*Def\b', re.IGNORECASE)
+
+# Line kinds that start or belong to a line item, and so always end an explanation
+ROW_KINDS = {'section', 'header', 'appropriation', 'activity', 'amounts', 'explanation'}
+
+# Program element number, e.g. 0604858F, optionally prefixed with "PE"
+PEM_RE = re.compile(r'\b(?:PE\s*)?(\d{7}[A-Z])\b')
+WHITESPACE_RE = re.compile(r'\s+')
+HYPHEN_SPACE_RE = re.compile(r'-\s+')
+
+
+def _amount(value):
+    """Normalize an OCR'd amount: drop thousands separators and a leading '+'"""
+    return value.replace(',', '').lstrip('+') if value else '-'
+
+
+def _fiscal_year(value):
+    """Expand a two-digit fiscal year"""
+    return f"20{value}"
+
+
+def iter_appropriation_rows(text, file_name=''):
+    """
+    Extract appropriation line items from OCR text
+
+    Args:
+        text: Text produced by process_pdf (or any OCR text)
+        file_name: Value for the 'file' column
+
+    Yields:
+        Dictionaries keyed by CSV_COLUMNS, in document order
+    """
+    context = {}
+    title = ''
+    pem = ''
+    row = None
+    explanation = None
+    # Where an open explanation stands: 'body' while its text runs, 'gap'
+    # after a blank line, 'break' inside a page break, 'header' inside the
+    # next page's running header
+    state = 'body'
+
+    def finish():
+        if explanation is not None:
+            row['explanation'] = WHITESPACE_RE.sub(' ', ' '.join(explanation)).strip()
+        return row
+
+    for line in text.splitlines():
+        line = line.strip()
+        match = LINE_RE.fullmatch(line)
+        kind = match.lastgroup
+
+        # An explanation runs until a blank line or any structural line. A
+        # page break (footer, page marker, the next page's running header)
+        # only interrupts it, even after a blank line, and the text that
+        # follows the break continues it
+        if explanation is not None:
+            if state == 'header' and kind not in ROW_KINDS:
+                if RUNNING_HEADER_END_RE.search(line):
+                    state = 'break'
+                continue
+            if kind == 'blank':
+                state = 'break' if state == 'break' else 'gap'
+                continue
+            if kind == 'page' or PAGE_FOOTER_RE.match(line):
+                state = 'break'
+                continue
+            if state == 'break' and RUNNING_HEADER_START_RE.match(line):
+                state = 'header'
+                continue
+            if state != 'gap' and (kind == 'text' or kind == 'number'):
+                explanation.append(line)
+                state = 'body'
+                continue
+            yield finish()
+            row, explanation, state = None, None, 'body'
+
+        if kind == 'header' or kind == 'section':
+            context, title, pem = {}, '', ''
+        elif kind == 'appropriation':
+            context = {
+                'appropriation_category': match.group('category').strip(),
+                'branch': HYPHEN_SPACE_RE.sub('-', match.group('branch')),
+                'fiscal_year_start': _fiscal_year(match.group('fy_start')),
+                'fiscal_year_end': _fiscal_year(match.group('fy_end'))
+            }
+            title, pem = '', ''
+        elif kind == 'activity' and context:
+            context['budget_activity_number'] = str(int(match.group('activity_number')))
+            context['budget_activity_title'] = match.group('activity_title').strip()
+            title, pem = '', ''
+        elif kind == 'text' and context:
+            # The last free-text line before the amounts names the line item;
+            # a program element number may share the line or stand alone
+            line_title = match.group(0).strip()
+            pem_match = PEM_RE.search(line_title)
+            if pem_match:
+                pem = pem_match.group(1)
+                line_title = (line_title[:pem_match.start()] + ' ' + line_title[pem_match.end():]).strip(' :-')
+            if line_title:
+                title = WHITESPACE_RE.sub(' ', line_title)
+        elif kind == 'amounts' and context:
+            if row is not None:
+                yield row
+            row = dict.fromkeys(CSV_COLUMNS, '')
+            row.update(context)
+            row.update({
+                'pem': pem,
+                'budget_title': title,
+                'program_base_congressional': _amount(match.group('base_congressional')),
+                'program_base_dod': _amount(match.group('base_dod')),
+                'reprogramming_amount': _amount(match.group('reprogramming')),
+                'revised_program_total': _amount(match.group('revised')),
+                'file': file_name
+            })
+            title, pem = '', ''
+        elif kind == 'explanation' and row is not None:
+            explanation = [match.group('explanation_text')]
+
+    if row is not None:
+        yield finish()
+
+
+def extract_appropriations(result, file_name=''):
+    """
+    Extract appropriation rows from a process_pdf result
+
+    Args:
+        result: Dictionary returned by process_pdf, or the text itself
+        file_name: Value for the 'file' column
+
+    Returns:
+        List of row dictionaries
+    """
+    text = result.get('text', '') if isinstance(result, dict) else result
+    return list(iter_appropriation_rows(text, file_name))
+
+
+def write_appropriations_csv(documents, output, write_header=True):
+    """
+    Stream appropriation rows from many documents into one CSV
+
+    Args:
+        documents: Iterable of (file_name, text) pairs
+        output: Writable text file object
+        write_header: Whether to write the column header first
+
+    Returns:
+        Number of rows written
+    """
+    writer = csv.DictWriter(output, fieldnames=CSV_COLUMNS)
+    if write_header:
+        writer.writeheader()
+
+    count = 0
+    for file_name, text in documents:
+        for row in iter_appropriation_rows(text, file_name):
+            writer.writerow(row)
+            count += 1
+
+    return count
+
+
+def main():
+    """
+    Convert OCR text files into a single appropriations CSV
+
+    Usage: python appropriations.py output.csv text_file [text_file ...]
+    """
+    if len(sys.argv) < 3:
+        print("Usage: python appropriations.py output.csv text_file [text_file ...]")
+        sys.exit(1)
+
+    def documents():
+        for path in sys.argv[2:]:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                yield os.path.basename(path), f.read()
+
+    with open(sys.argv[1], 'w', newline='', encoding='utf-8') as output:
+        count = write_appropriations_csv(documents(), output)
+
+    print(f"Wrote {count} appropriation rows to {sys.argv[1]}")
+
+
+if __name__ == "__main__":
+    main()
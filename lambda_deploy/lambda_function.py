@@ -4,7 +4,13 @@ AWS Lambda function for StealthOCR PDF processing
 
 import json
 import base64
+import hashlib
+import concurrent.futures
+import math
+import multiprocessing
+import shutil
 import tempfile
+import time
 import os
 import sys
 from io import BytesIO
@@ -19,7 +25,11 @@ sys.path.append('/opt/python/src')
 
 try:
     from stealth_ocr import StealthOCR
-    from pdf2image import convert_from_path
+    from sharding import (split_page_ranges, run_shards, LambdaInvokeWorker, PageRangeError,
+                          encode_continuation_token, decode_continuation_token, resolve_page_range)
+    from memory_governor import MemoryGovernor
+    from appropriations import extract_appropriations
+    from pdf2image import convert_from_path, pdfinfo_from_path
     import cv2
     import numpy as np
     from PIL import Image
@@ -30,18 +40,53 @@ except ImportError as e:
 # Initialize OCR (this will be done once per container)
 ocr = None
 
+# Time kept in reserve so the handler can return before Lambda kills it
+DEADLINE_SAFETY_MS = 5000
+
+# Worker function used by coordinator mode; without it shards run in local processes
+WORKER_FUNCTION_NAME = os.environ.get('STEALTH_OCR_WORKER_FUNCTION')
+WORKER_TIMEOUT_S = int(os.environ.get('STEALTH_OCR_WORKER_TIMEOUT', 900))
+
+# Coordinator fan-out limits: shards per document, shards in flight, default shard size
+MAX_SHARDS = int(os.environ.get('STEALTH_OCR_MAX_SHARDS', 32))
+MAX_CONCURRENT_SHARDS = int(os.environ.get('STEALTH_OCR_MAX_CONCURRENT_SHARDS', 8))
+DEFAULT_PAGES_PER_SHARD = int(os.environ.get('STEALTH_OCR_PAGES_PER_SHARD', 5))
+
+# Tiled OCR for very large pages; disabled unless STEALTH_OCR_TILE_SIZE is set
+TILE_SIZE = int(os.environ['STEALTH_OCR_TILE_SIZE']) if os.environ.get('STEALTH_OCR_TILE_SIZE') else None
+TILE_OVERLAP = int(os.environ.get('STEALTH_OCR_TILE_OVERLAP', 200))
+TILE_WORKERS = int(os.environ['STEALTH_OCR_TILE_WORKERS']) if os.environ.get('STEALTH_OCR_TILE_WORKERS') else None
+
+# Perceptual hash index shared across invocations (e.g. on EFS); disabled when unset
+HASH_INDEX_PATH = os.environ.get('STEALTH_OCR_HASH_INDEX')
+HASH_REUSE = os.environ.get('STEALTH_OCR_HASH_REUSE', '').lower() in ('1', 'true', 'yes')
+HASH_TOLERANCE = float(os.environ.get('STEALTH_OCR_HASH_TOLERANCE', 1.5e-6))
+
+# Rendered pages survive in /tmp across warm invocations of the same container
+RASTER_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'stealth_ocr_pages')
+
+# Pages rendered ahead but never OCR'd (deadline stop, error, abandoned
+# continuation) are swept once older than this or when the cache is too big
+RASTER_CACHE_MAX_AGE_S = int(os.environ.get('STEALTH_OCR_RASTER_CACHE_MAX_AGE', 3600))
+RASTER_CACHE_MAX_BYTES = int(os.environ.get('STEALTH_OCR_RASTER_CACHE_MB', 256)) * 1024 * 1024
+
 def init_ocr():
     """Initialize OCR engine"""
     global ocr
     if ocr is None:
         try:
-            ocr = StealthOCR()
+            ocr = StealthOCR(tile_size=TILE_SIZE,
+                             tile_overlap=TILE_OVERLAP,
+                             tile_workers=TILE_WORKERS,
+                             hash_index_path=HASH_INDEX_PATH,
+                             hash_tolerance=HASH_TOLERANCE,
+                             hash_reuse=HASH_REUSE)
             logger.info("OCR engine initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize OCR: {e}")
             raise
 
-def lambda_handler(event, context):
+def lambda_handler(event, context, ocr_instance=None, memory_budget=None, concurrency=1):
     """
     AWS Lambda handler for PDF OCR processing
     
@@ -56,10 +101,22 @@ def lambda_handler(event, context):
             "engine": "tesseract"  # optional
         }
     }
-    """
     
-    # Initialize OCR if not already done
-    init_ocr()
+    The JSON body may also carry a "continuation_token" returned by an
+    earlier call that ran out of time, to resume from the next page,
+    "first_page"/"last_page" to process only part of the document, or
+    "mode": "coordinator" to split the document into page ranges that are
+    processed by separate workers and merged in order. A "deadline" (UNIX
+    timestamp, set by the coordinator for its workers) stops processing
+    earlier than the invocation's own timeout. With
+    "extract_appropriations": true the response also carries the parsed
+    appropriation rows under "appropriations".
+    
+    ocr_instance lets a caller that manages its own pool of StealthOCR
+    engines (see server.py) use one of them instead of the global engine;
+    memory_budget and concurrency then give this request its share of the
+    process memory.
+    """
     
     try:
         # Parse the event
@@ -133,8 +190,65 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': f'Invalid base64 data: {str(e)}'})
             }
         
-        # Process PDF
-        result = process_pdf(pdf_bytes, engine)
+        # Validate the continuation token, if resuming a previous call
+        continuation_token = body.get('continuation_token')
+        if continuation_token:
+            try:
+                decode_continuation_token(continuation_token)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': str(e)})
+                }
+        
+        if continuation_token and body.get('mode') == 'coordinator':
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'error': 'continuation_token cannot be used in coordinator mode; '
+                                             'resume each pending range without "mode"'})
+            }
+        
+        # Process PDF; the coordinator only dispatches, so it needs no OCR engine
+        try:
+            if body.get('mode') == 'coordinator':
+                result = process_pdf_sharded(pdf_bytes, engine,
+                                             pages_per_shard=body.get('pages_per_shard'),
+                                             context=context,
+                                             memory_budget=memory_budget,
+                                             concurrency=concurrency)
+            else:
+                # Initialize OCR if not already done
+                if ocr_instance is None:
+                    init_ocr()
+                result = process_pdf(pdf_bytes, engine,
+                                     context=context,
+                                     deadline=body.get('deadline'),
+                                     continuation_token=continuation_token,
+                                     first_page=body.get('first_page'),
+                                     last_page=body.get('last_page'),
+                                     ocr_instance=ocr_instance,
+                                     memory_budget=memory_budget,
+                                     concurrency=concurrency)
+        except PageRangeError as e:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        if body.get('extract_appropriations') and result.get('success'):
+            result['appropriations'] = extract_appropriations(result, body.get('file_name', ''))
         
         return {
             'statusCode': 200,
@@ -156,36 +270,257 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': f'Internal server error: {str(e)}'})
         }
 
-def process_pdf(pdf_bytes, engine='tesseract'):
+def get_remaining_time_ms(context=None, deadline=None):
+    """
+    Get the time left before the invocation has to return
+    
+    Args:
+        context: Lambda context object (optional)
+        deadline: Absolute deadline as a UNIX timestamp in seconds (optional)
+    
+    Returns:
+        Remaining milliseconds, or None if there is no deadline
+    """
+    remaining = []
+    
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        remaining.append(context.get_remaining_time_in_millis())
+    
+    if deadline is not None:
+        remaining.append((deadline - time.time()) * 1000)
+    
+    return min(remaining) if remaining else None
+
+def _cached_page_path(pdf_sha256, page_number, dpi):
+    """Path of the cached rasterization of a page"""
+    return os.path.join(RASTER_CACHE_DIR, f"{pdf_sha256[:16]}_{dpi}_{page_number}.ppm")
+
+def render_pages(pdf_path, pdf_sha256, first_page, last_page, dpi=300):
+    """
+    Rasterize a range of PDF pages into the /tmp cache
+    
+    Pages are written by pdftoppm straight to disk in a single pass, so a
+    window of pages costs one subprocess and no memory until each page is
+    loaded. Rendering stops at the first page already in the cache, which
+    lets a call interrupted before OCR'ing them resume without re-rendering.
+    
+    pdftoppm writes into a private directory and finished pages are moved
+    into the cache, so a concurrent sweep never removes a half-done render.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        pdf_sha256: SHA-256 hex digest of the PDF contents
+        first_page: First page (1-based) to render
+        last_page: Last page (1-based) to render
+        dpi: Rendering resolution
+    """
+    # Render the run of uncached pages at the start of the range
+    missing = []
+    for page in range(first_page, last_page + 1):
+        if os.path.exists(_cached_page_path(pdf_sha256, page, dpi)):
+            break
+        missing.append(page)
+    if not missing:
+        return
+    
+    os.makedirs(RASTER_CACHE_DIR, exist_ok=True)
+    render_dir = tempfile.mkdtemp(prefix='rendering-', dir=RASTER_CACHE_DIR)
+    try:
+        paths = convert_from_path(pdf_path, dpi=dpi,
+                                  first_page=missing[0], last_page=missing[-1],
+                                  output_folder=render_dir, output_file='page',
+                                  fmt='ppm', paths_only=True)
+        
+        # pdftoppm zero-pads page numbers, so name order is page order
+        for page_number, path in zip(range(missing[0], missing[-1] + 1), sorted(paths)):
+            os.replace(path, _cached_page_path(pdf_sha256, page_number, dpi))
+    finally:
+        shutil.rmtree(render_dir, ignore_errors=True)
+
+def render_page(pdf_path, pdf_sha256, page_number, dpi=300, window_last_page=None):
+    """
+    Load a rasterized PDF page, rendering it (and the rest of its window) if needed
+    
+    The cache is shared by every request in the process and container, so
+    a page that vanishes before it is loaded is rendered again directly.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        pdf_sha256: SHA-256 hex digest of the PDF contents
+        page_number: Page to load (1-based)
+        dpi: Rendering resolution
+        window_last_page: Last page to render ahead in the same pass (optional)
+    
+    Returns:
+        PIL image of the page
+    """
+    cached_path = _cached_page_path(pdf_sha256, page_number, dpi)
+    
+    if not os.path.exists(cached_path):
+        render_pages(pdf_path, pdf_sha256, page_number, window_last_page or page_number, dpi)
+    else:
+        logger.info(f"Reusing cached rasterization of page {page_number}")
+    
+    try:
+        with Image.open(cached_path) as image:
+            image.load()
+            return image
+    except FileNotFoundError:
+        # The cache is shared: a concurrent request on the same PDF (e.g. a
+        # client retry) or a sweep removed the page after it was rendered
+        logger.info(f"Cached page {page_number} disappeared, rendering it in memory")
+        return convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)[0]
+
+def sweep_raster_cache(max_age_s=None, max_bytes=None):
+    """
+    Evict stale or excess rasterizations from the /tmp page cache
+    
+    Files older than max_age_s are removed first; if the cache is still
+    larger than max_bytes, the oldest remaining files go next. Render
+    directories still in use are left alone; ones older than max_age_s
+    were left behind by a killed invocation and are removed.
+    
+    Args:
+        max_age_s: Maximum file age in seconds (defaults to RASTER_CACHE_MAX_AGE_S)
+        max_bytes: Maximum total cache size (defaults to RASTER_CACHE_MAX_BYTES)
+    
+    Returns:
+        Number of files removed
+    """
+    max_age_s = RASTER_CACHE_MAX_AGE_S if max_age_s is None else max_age_s
+    max_bytes = RASTER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    
+    try:
+        entries = []
+        with os.scandir(RASTER_CACHE_DIR) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.is_file():
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.is_dir() and time.time() - stat.st_mtime > max_age_s:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+    except FileNotFoundError:
+        return 0
+    
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    
+    for mtime, size, path in sorted(entries):
+        if now - mtime <= max_age_s and total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to evict cached page: {e}")
+            continue
+        total -= size
+    
+    if removed:
+        logger.info(f"Evicted {removed} cached pages from {RASTER_CACHE_DIR}")
+    return removed
+
+def _discard_cached_page(pdf_sha256, page_number, dpi=300):
+    """Remove a cached rasterization once the page has been OCR'd"""
+    cached_path = _cached_page_path(pdf_sha256, page_number, dpi)
+    if os.path.exists(cached_path):
+        try:
+            os.unlink(cached_path)
+        except Exception as e:
+            logger.warning(f"Failed to delete cached page: {e}")
+
+def process_pdf(pdf_bytes, engine='tesseract', context=None, deadline=None,
+                continuation_token=None, first_page=None, last_page=None,
+                ocr_instance=None, memory_budget=None, concurrency=1):
     """
     Process PDF and extract text using OCR
     
+    Before each page the remaining invocation time is compared with the
+    slowest page seen so far. When the next page would not fit, processing
+    stops cleanly and the completed pages are returned together with a
+    continuation token for the remaining page range.
+    
+    Rendering DPI and the number of pages rendered ahead are chosen by a
+    MemoryGovernor from the page sizes and the memory budget, and DPI is
+    lowered if RSS gets close to the budget during the run.
+    
     Args:
         pdf_bytes: PDF file as bytes
         engine: OCR engine to use ('tesseract' or 'easyocr')
+        context: Lambda context used to read the remaining time (optional)
+        deadline: Absolute deadline as a UNIX timestamp in seconds (optional)
+        continuation_token: Token from a previous partial result (optional)
+        first_page: First page (1-based) to process (optional)
+        last_page: Last page (1-based) to process (optional)
+        ocr_instance: StealthOCR engine to use instead of the global one (optional)
+        memory_budget: Memory budget in bytes (optional, detected when omitted)
+        concurrency: Number of requests sharing this process and its memory
     
     Returns:
         Dictionary with extraction results
+    
+    Raises:
+        PageRangeError: If the requested pages or the continuation token do
+            not fit the document
     """
     temp_pdf_path = None
+    ocr_instance = ocr_instance or ocr
     
     try:
+        pdf_sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+        sweep_raster_cache()
+        
         # Save PDF to temporary file
         with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
             tmp_file.write(pdf_bytes)
             temp_pdf_path = tmp_file.name
         
-        logger.info("Converting PDF to images...")
+        total_pages = pdfinfo_from_path(temp_pdf_path)['Pages']
+        first_page, last_page = resolve_page_range(total_pages, pdf_sha256, first_page, last_page,
+                                                   continuation_token)
+        
+        logger.info(f"Processing pages {first_page}-{last_page} of {total_pages}...")
         
-        # Convert PDF to images
-        images = convert_from_path(temp_pdf_path, dpi=300)
-        logger.info(f"Converted to {len(images)} pages")
+        governor = MemoryGovernor(budget_bytes=memory_budget, engine=engine,
+                                  concurrency=concurrency)
+        governor.plan(temp_pdf_path, first_page, last_page)
+        hash_hits_before = ocr_instance.hash_index_hits
         
         all_text = []
-        total_pages = len(images)
+        pages_processed = 0
+        next_page = first_page
+        slowest_page_ms = 0
         
-        for i, image in enumerate(images):
-            logger.info(f"Processing page {i+1}/{total_pages}...")
+        while next_page <= last_page:
+            remaining_ms = get_remaining_time_ms(context, deadline)
+            if remaining_ms is not None and remaining_ms < slowest_page_ms + DEADLINE_SAFETY_MS:
+                logger.info(f"Stopping before page {next_page}: {remaining_ms:.0f}ms remaining")
+                break
+            
+            page_start = time.time()
+            logger.info(f"Processing page {next_page}/{total_pages}...")
+            
+            dpi = governor.dpi
+            if governor.check():
+                # Pages rendered ahead at the old DPI are too big to load now
+                for page in range(next_page, last_page + 1):
+                    _discard_cached_page(pdf_sha256, page, dpi)
+                dpi = governor.dpi
+            
+            image = render_page(temp_pdf_path, pdf_sha256, next_page, dpi,
+                                window_last_page=min(next_page + governor.window - 1, last_page))
+            
+            # Rendering may have eaten the budget; keep the page cached for the next call
+            remaining_ms = get_remaining_time_ms(context, deadline)
+            if remaining_ms is not None and remaining_ms < slowest_page_ms + DEADLINE_SAFETY_MS:
+                logger.info(f"Stopping after rendering page {next_page}: {remaining_ms:.0f}ms remaining")
+                break
             
             # Convert PIL image to OpenCV format
             img_array = np.array(image)
@@ -193,13 +528,21 @@ def process_pdf(pdf_bytes, engine='tesseract'):
                 img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
             
             # Extract text from the page
-            page_text = ocr.extract_text(img_array, engine=engine)
+            page_text = ocr_instance.extract_text(img_array, engine=engine)
+            _discard_cached_page(pdf_sha256, next_page, dpi)
+            del image, img_array
             
             if page_text.strip():
-                all_text.append(f"=== PAGE {i+1} ===\n{page_text}\n")
-                logger.info(f"Extracted {len(page_text)} characters from page {i+1}")
+                all_text.append(f"=== PAGE {next_page} ===\n{page_text}\n")
+                logger.info(f"Extracted {len(page_text)} characters from page {next_page}")
             else:
-                logger.info(f"No text found on page {i+1}")
+                logger.info(f"No text found on page {next_page}")
+            
+            slowest_page_ms = max(slowest_page_ms, (time.time() - page_start) * 1000)
+            pages_processed += 1
+            next_page += 1
+        
+        complete = next_page > last_page
         
         # Combine all text
         full_text = "\n".join(all_text)
@@ -212,12 +555,22 @@ def process_pdf(pdf_bytes, engine='tesseract'):
             'success': True,
             'text': full_text,
             'engine': engine,
-            'pages_processed': total_pages,
+            'pages_processed': pages_processed,
+            'total_pages': total_pages,
+            'first_page': first_page,
+            'last_page': next_page - 1,
+            'complete': complete,
+            'dpi': governor.dpi,
+            'pages_from_hash_index': ocr_instance.hash_index_hits - hash_hits_before,
+            'continuation_token': None if complete else encode_continuation_token(pdf_sha256, next_page, last_page),
+            'next_page_range': None if complete else [next_page, last_page],
             'character_count': char_count,
             'word_count': word_count,
             'line_count': len(full_text.split('\n')) if full_text else 0
         }
         
+    except PageRangeError:
+        raise
     except Exception as e:
         logger.error(f"Error processing PDF: {str(e)}")
         return {
@@ -238,6 +591,134 @@ def process_pdf(pdf_bytes, engine='tesseract'):
             except Exception as e:
                 logger.warning(f"Failed to delete temporary file: {e}")
 
+def process_pdf_range(pdf_bytes, engine, first_page, last_page, deadline=None,
+                      memory_budget=None):
+    """
+    Worker entry point for one shard of a coordinated run
+    
+    Safe to call in a fresh process: the OCR engine is initialized on demand.
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        engine: OCR engine to use
+        first_page: First page (1-based) of the shard
+        last_page: Last page (1-based) of the shard
+        deadline: Absolute deadline as a UNIX timestamp in seconds (optional)
+        memory_budget: This shard's share of the memory budget in bytes (optional)
+    
+    Returns:
+        Dictionary with extraction results for the page range
+    """
+    init_ocr()
+    return process_pdf(pdf_bytes, engine, deadline=deadline,
+                       first_page=first_page, last_page=last_page,
+                       memory_budget=memory_budget)
+
+def process_pdf_sharded(pdf_bytes, engine='tesseract', pages_per_shard=None,
+                        max_workers=None, worker=None, executor=None, context=None,
+                        memory_budget=None, concurrency=1):
+    """
+    Coordinator: split a PDF into page ranges, fan them out and merge the results
+    
+    By default shards are sent to the Lambda named by STEALTH_OCR_WORKER_FUNCTION,
+    or to local worker processes when it is not set, in which case the
+    number of processes is capped by the MemoryGovernor and each gets an
+    equal share of the memory budget. Worker processes
+    are spawned rather than forked so they never share the parent's OCR
+    models or SQLite connections. Where processes cannot be started (AWS
+    Lambda has no /dev/shm), the shards run one after another in-process.
+    
+    Fan-out is bounded by MAX_SHARDS shards per document and
+    MAX_CONCURRENT_SHARDS shards in flight. With a context, workers are
+    given a deadline that leaves the coordinator time to merge, and shards
+    still running when the coordinator's own time is nearly up are
+    returned as pending page ranges with continuation tokens.
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        engine: OCR engine to use
+        pages_per_shard: Pages per shard (optional, defaults to DEFAULT_PAGES_PER_SHARD)
+        max_workers: Number of concurrent shards (optional)
+        worker: Callable(pdf_bytes, engine, first_page, last_page, **kwargs) (optional)
+        executor: concurrent.futures.Executor to run the worker (optional)
+        context: Lambda context, its deadline is forwarded to the workers (optional)
+        memory_budget: Memory budget in bytes shared by the local shards
+            (optional, detected when omitted)
+        concurrency: Number of requests sharing this process and its memory
+    
+    Returns:
+        Dictionary with merged extraction results
+    """
+    if worker is None:
+        if WORKER_FUNCTION_NAME:
+            worker = LambdaInvokeWorker(WORKER_FUNCTION_NAME, timeout=WORKER_TIMEOUT_S)
+        else:
+            worker = process_pdf_range
+    
+    shard_budget = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as tmp_file:
+            tmp_file.write(pdf_bytes)
+            tmp_file.flush()
+            total_pages = pdfinfo_from_path(tmp_file.name)['Pages']
+            if worker is process_pdf_range:
+                # Plan within the caller's share, e.g. one server worker's
+                plan = MemoryGovernor(budget_bytes=memory_budget, engine=engine,
+                                      concurrency=concurrency).plan(tmp_file.name)
+                shard_budget = plan['budget']
+                if max_workers is None:
+                    max_workers = plan['workers']
+    except Exception as e:
+        logger.error(f"Error reading PDF: {str(e)}")
+        return {
+            'success': False,
+            'error': str(e),
+            'text': '',
+            'pages_processed': 0,
+            'character_count': 0,
+            'word_count': 0,
+            'line_count': 0
+        }
+    
+    max_workers = max(1, min(max_workers or MAX_CONCURRENT_SHARDS, MAX_CONCURRENT_SHARDS))
+    pages_per_shard = max(int(pages_per_shard or DEFAULT_PAGES_PER_SHARD),
+                          math.ceil(total_pages / MAX_SHARDS))
+    ranges = split_page_ranges(total_pages, pages_per_shard=pages_per_shard)
+    logger.info(f"Dispatching {len(ranges)} shards for {total_pages} pages")
+    
+    worker_kwargs = {}
+    wait_until = None
+    remaining_ms = get_remaining_time_ms(context)
+    if remaining_ms is not None:
+        wait_until = time.time() + (remaining_ms - DEADLINE_SAFETY_MS) / 1000
+        worker_kwargs['deadline'] = wait_until - DEADLINE_SAFETY_MS / 1000
+    
+    owns_executor = executor is None
+    pool_size = max(1, min(max_workers, len(ranges)))
+    if owns_executor:
+        if worker is process_pdf_range:
+            try:
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=pool_size, mp_context=multiprocessing.get_context('spawn'))
+            except (OSError, NotImplementedError) as e:
+                logger.warning(f"Worker processes unavailable ({e}), running shards in-process")
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+                pool_size = 1
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size)
+    
+    # Shards running side by side split the budget instead of each assuming all of it
+    if shard_budget is not None:
+        worker_kwargs['memory_budget'] = shard_budget // pool_size
+    
+    try:
+        return run_shards(pdf_bytes, ranges, worker, executor, engine,
+                          wait_until=wait_until, **worker_kwargs)
+    finally:
+        if owns_executor:
+            # Only shards abandoned at the deadline can still be running
+            executor.shutdown(wait=False, cancel_futures=True)
+
 # For local testing
 if __name__ == "__main__":
     # Test event
@@ -0,0 +1,236 @@
+"""
+Memory-budget governor for PDF rasterization and OCR
+"""
+
+import gc
+import os
+import shutil
+import tempfile
+import logging
+
+try:
+    from PyPDF2 import PdfReader
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger()
+
+# Bytes held per rendered pixel while a page is OCR'd: the PIL RGB image, its
+# numpy/BGR copies and the grayscale, blurred and thresholded preprocessing
+# stages, plus the copy handed to the OCR engine
+BYTES_PER_PIXEL = {
+    'tesseract': 16,
+    'easyocr': 40
+}
+
+# Extra memory for each additional OCR worker process (interpreter, OpenCV, models)
+WORKER_OVERHEAD_BYTES = 512 * 1024 * 1024
+
+# Largest common page (US Legal) assumed when page sizes cannot be read
+DEFAULT_PAGE_SIZE_PTS = (612, 1008)
+
+DPI_STEPS = (300, 250, 200, 150, 100)
+
+
+def detect_memory_limit():
+    """
+    Detect the memory available to this process
+
+    Checks, in order, STEALTH_OCR_MEMORY_BUDGET_MB, the Lambda memory size,
+    the cgroup v2 and v1 limits and finally physical memory.
+
+    Returns:
+        Memory limit in bytes
+    """
+    for env_var in ('STEALTH_OCR_MEMORY_BUDGET_MB', 'AWS_LAMBDA_FUNCTION_MEMORY_SIZE'):
+        value = os.environ.get(env_var)
+        if value:
+            try:
+                return int(value) * 1024 * 1024
+            except ValueError:
+                logger.warning(f"Ignoring invalid {env_var}: {value}")
+
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            # Unlimited cgroups report 'max' (v2) or a huge page-aligned number (v1)
+            if value != 'max' and int(value) < 1 << 60:
+                return int(value)
+        except (OSError, ValueError):
+            continue
+
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def current_rss():
+    """
+    Get the resident set size of this process
+
+    Returns:
+        RSS in bytes
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Peak RSS is the best we can do without /proc; ru_maxrss is in KB on Linux
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_page_sizes(pdf_path, first_page=1, last_page=None):
+    """
+    Read page sizes from the PDF without rendering it
+
+    Args:
+        pdf_path: Path to the PDF file
+        first_page: First page (1-based)
+        last_page: Last page (1-based, optional)
+
+    Returns:
+        List of (width, height) tuples in points
+    """
+    if PdfReader is None:
+        return [DEFAULT_PAGE_SIZE_PTS]
+
+    try:
+        reader = PdfReader(pdf_path)
+        pages = reader.pages[first_page - 1:last_page]
+        sizes = []
+        for page in pages:
+            user_unit = float(page.get('/UserUnit', 1))
+            sizes.append((float(page.mediabox.width) * user_unit,
+                          float(page.mediabox.height) * user_unit))
+        return sizes or [DEFAULT_PAGE_SIZE_PTS]
+    except Exception as e:
+        logger.warning(f"Could not read page sizes, assuming {DEFAULT_PAGE_SIZE_PTS}: {e}")
+        return [DEFAULT_PAGE_SIZE_PTS]
+
+
+class MemoryGovernor:
+    """
+    Picks DPI, render window and worker count so a document stays within a
+    memory budget, and lowers DPI if measured RSS approaches the limit
+    """
+
+    def __init__(self,
+                 budget_bytes=None,
+                 engine='tesseract',
+                 headroom=0.8,
+                 high_water=0.9,
+                 max_window=4,
+                 dpi_steps=DPI_STEPS,
+                 concurrency=1):
+        """
+        Initialize the governor
+
+        Args:
+            budget_bytes: Memory budget in bytes (optional, detected when omitted)
+            engine: OCR engine the pages will be processed with
+            headroom: Fraction of the budget that planning may use
+            high_water: Fraction of the budget at which RSS triggers a step down
+            max_window: Maximum number of pages rendered ahead in one pass
+            dpi_steps: Candidate DPIs, highest first
+            concurrency: Number of workers sharing this process, each charged
+                an equal part of its RSS
+        """
+        self.budget = budget_bytes or detect_memory_limit()
+        self.bytes_per_pixel = BYTES_PER_PIXEL.get(engine, BYTES_PER_PIXEL['easyocr'])
+        self.headroom = headroom
+        self.high_water = high_water
+        self.max_window = max_window
+        self.dpi_steps = tuple(sorted(dpi_steps, reverse=True))
+        self.dpi = self.dpi_steps[0]
+        self.window = 1
+        self.workers = 1
+        self.max_page_pts = DEFAULT_PAGE_SIZE_PTS
+        self.concurrency = max(1, int(concurrency))
+
+    def _rss(self):
+        """This worker's share of the process RSS"""
+        return current_rss() // self.concurrency
+
+    def page_bytes(self, dpi=None):
+        """Estimated peak memory for OCR'ing the largest page at a DPI"""
+        dpi = dpi or self.dpi
+        width, height = self.max_page_pts
+        return int((width / 72 * dpi) * (height / 72 * dpi) * self.bytes_per_pixel)
+
+    def plan(self, pdf_path, first_page=1, last_page=None):
+        """
+        Choose DPI, render window and worker count for a page range
+
+        Args:
+            pdf_path: Path to the PDF file
+            first_page: First page (1-based)
+            last_page: Last page (1-based, optional)
+
+        Returns:
+            Dictionary with 'dpi', 'window', 'workers', 'page_bytes' and 'budget'
+        """
+        sizes = get_page_sizes(pdf_path, first_page, last_page)
+        self.max_page_pts = max(sizes, key=lambda s: s[0] * s[1])
+
+        available = self.budget * self.headroom - self._rss()
+
+        # Highest DPI at which a single page fits, falling back to the lowest
+        self.dpi = self.dpi_steps[-1]
+        for dpi in self.dpi_steps:
+            if self.page_bytes(dpi) <= available:
+                self.dpi = dpi
+                break
+
+        page_bytes = self.page_bytes()
+        self.workers = int(max(1, min(os.cpu_count() or 1,
+                                      available // (page_bytes + WORKER_OVERHEAD_BYTES))))
+
+        # Rendered pages wait on disk as raw PPM (3 bytes per pixel), so the
+        # window is bounded by free space in the temp directory
+        width, height = self.max_page_pts
+        ppm_bytes = (width / 72 * self.dpi) * (height / 72 * self.dpi) * 3
+        try:
+            free = shutil.disk_usage(tempfile.gettempdir()).free
+            self.window = int(max(1, min(self.max_window, free * 0.5 // ppm_bytes)))
+        except OSError:
+            self.window = 1
+
+        logger.info(f"Memory plan: budget {self.budget // (1024 * 1024)}MB, dpi {self.dpi}, "
+                    f"window {self.window}, workers {self.workers}, "
+                    f"~{page_bytes // (1024 * 1024)}MB per page")
+
+        return {
+            'dpi': self.dpi,
+            'window': self.window,
+            'workers': self.workers,
+            'page_bytes': page_bytes,
+            'budget': self.budget
+        }
+
+    def check(self):
+        """
+        Compare measured RSS with the budget and degrade if it is too close
+
+        Returns:
+            True if the DPI or window was lowered
+        """
+        limit = self.budget * self.high_water
+        if self._rss() < limit:
+            return False
+
+        gc.collect()
+        rss = self._rss()
+        if rss < limit:
+            return False
+
+        lower = [dpi for dpi in self.dpi_steps if dpi < self.dpi]
+        if not lower and self.window == 1:
+            logger.warning(f"RSS {rss // (1024 * 1024)}MB near budget, already at minimum settings")
+            return False
+
+        if lower:
+            self.dpi = lower[0]
+        self.window = 1
+        logger.warning(f"RSS {rss // (1024 * 1024)}MB near budget, "
+                       f"lowering to dpi {self.dpi}, window {self.window}")
+        return True
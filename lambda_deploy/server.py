@@ -0,0 +1,316 @@
+"""
+Standalone HTTP server for self-hosting StealthOCR
+
+Keeps a pool of pre-warmed StealthOCR engines, queues requests up to a
+configurable depth and answers 429 with a Retry-After hint when saturated.
+Requests and responses use the same schema as the Lambda function.
+"""
+
+import json
+import math
+import os
+import sys
+import time
+import queue
+import threading
+import argparse
+import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from stealth_ocr import StealthOCR
+from page_hash import PageHashIndex
+from lambda_function import lambda_handler, DEADLINE_SAFETY_MS
+from memory_governor import detect_memory_limit
+
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+
+
+class RequestContext:
+    """
+    Minimal stand-in for the Lambda context, so long documents stop before
+    the request timeout and return a continuation token
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.time()) * 1000))
+
+
+class OCRWorkerPool:
+    """
+    Fixed pool of worker threads, each owning a pre-warmed StealthOCR engine,
+    fed from a bounded queue
+    """
+
+    def __init__(self, workers=2, max_queue=8, request_timeout=300, **ocr_kwargs):
+        """
+        Initialize the pool and warm up its engines
+
+        Args:
+            workers: Number of concurrent OCR workers
+            max_queue: Maximum number of requests waiting for a worker
+            request_timeout: Seconds a request may spend queued and processing
+            **ocr_kwargs: Keyword arguments passed to StealthOCR
+        """
+        self.workers = workers
+        # Workers share one process, so each plans against its share of the memory
+        self.memory_budget = detect_memory_limit() // workers
+        self.request_timeout = request_timeout
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.completed = 0
+        self.rejected = 0
+        # Exponentially weighted average of service time, used for retry hints
+        self.avg_service_s = 5.0
+
+        # One index for all engines, so a page recorded by one worker is seen by the others
+        hash_index_path = ocr_kwargs.pop('hash_index_path', None)
+        if hash_index_path:
+            ocr_kwargs['hash_index'] = PageHashIndex(
+                hash_index_path,
+                max_distance=ocr_kwargs.pop('hash_max_distance', 10),
+                max_content_difference=ocr_kwargs.pop('hash_tolerance', 1.5e-6))
+
+        for i in range(workers):
+            ocr_instance = StealthOCR(**ocr_kwargs)
+            logger.info(f"Worker {i + 1}/{workers} warmed up")
+            threading.Thread(target=self._run, args=(ocr_instance,), daemon=True,
+                             name=f"ocr-worker-{i + 1}").start()
+
+    def _run(self, ocr_instance):
+        """Worker loop: take the next job and run it on this worker's engine"""
+        while True:
+            event, deadline, future = self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            with self.lock:
+                self.busy += 1
+            start = time.time()
+
+            try:
+                future.set_result(lambda_handler(event, RequestContext(deadline),
+                                                 ocr_instance=ocr_instance,
+                                                 memory_budget=self.memory_budget,
+                                                 concurrency=self.workers))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                    self.completed += 1
+                    self.avg_service_s += 0.2 * (time.time() - start - self.avg_service_s)
+
+    def reject(self):
+        """Count a request turned away because the queue is full"""
+        with self.lock:
+            self.rejected += 1
+
+    def submit(self, event):
+        """
+        Queue a request
+
+        Args:
+            event: Lambda-style event dictionary
+
+        Returns:
+            Future resolving to a Lambda-style response
+
+        Raises:
+            queue.Full: If the queue is at its maximum depth
+        """
+        future = Future()
+        try:
+            self.jobs.put_nowait((event, time.time() + self.request_timeout, future))
+        except queue.Full:
+            self.reject()
+            raise
+        return future
+
+    def full(self):
+        """Whether a new request would be rejected right now"""
+        return self.jobs.full()
+
+    def retry_after(self):
+        """Estimated seconds until a queue slot frees up"""
+        with self.lock:
+            waiting = self.jobs.qsize() + self.busy
+            return max(1, math.ceil(self.avg_service_s * waiting / self.workers))
+
+    def stats(self):
+        """Current pool statistics"""
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'busy': self.busy,
+                'queued': self.jobs.qsize(),
+                'max_queue': self.jobs.maxsize,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_service_seconds': round(self.avg_service_s, 3)
+            }
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end translating requests into Lambda-style events"""
+
+    pool = None
+    max_body_bytes = 64 * 1024 * 1024
+
+    def _send(self, status, body, headers=None):
+        payload = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        for name, value in {**CORS_HEADERS, **(headers or {})}.items():
+            self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, data, headers=None):
+        self._send(status, json.dumps(data), {'Content-Type': 'application/json', **(headers or {})})
+
+    def do_OPTIONS(self):
+        self._send(200, '')
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self._send_json(200, {'status': 'ok', **self.pool.stats()})
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def _send_busy(self):
+        retry_after = self.pool.retry_after()
+        self._send_json(429, {'error': 'Server busy, retry later', 'retry_after': retry_after},
+                        {'Retry-After': retry_after})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+
+        # Turn requests away before reading their body; the unread body
+        # means the connection cannot be reused
+        if self.pool.full():
+            self.close_connection = True
+            self.pool.reject()
+            self._send_busy()
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            self.close_connection = True
+            self._send_json(400, {'error': 'Invalid Content-Length'})
+            return
+
+        if length > self.max_body_bytes:
+            self.close_connection = True
+            self._send_json(413, {'error': f'Request body larger than {self.max_body_bytes} bytes'})
+            return
+
+        event = {
+            'httpMethod': 'POST',
+            'path': url.path,
+            'body': self.rfile.read(length).decode('utf-8'),
+            'headers': dict(self.headers),
+            'queryStringParameters': dict(parse_qsl(url.query))
+        }
+
+        try:
+            future = self.pool.submit(event)
+        except queue.Full:
+            self._send_busy()
+            return
+
+        try:
+            # Workers return before the deadline on their own; the margin covers the last page
+            response = future.result(timeout=self.pool.request_timeout + DEADLINE_SAFETY_MS / 1000)
+        except FutureTimeoutError:
+            future.cancel()
+            self._send_json(504, {'error': 'Request timed out'})
+            return
+        except Exception as e:
+            logger.error(f"Request failed: {e}")
+            self._send_json(500, {'error': f'Internal server error: {str(e)}'})
+            return
+
+        self._send(response['statusCode'], response.get('body', ''), response.get('headers'))
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} - {format % args}")
+
+
+def main():
+    """
+    Run the StealthOCR HTTP server
+    """
+    parser = argparse.ArgumentParser(description='StealthOCR HTTP server')
+    parser.add_argument('--host', default='0.0.0.0', help='Address to bind')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of pre-warmed OCR workers')
+    parser.add_argument('--max-queue', type=int, default=8,
+                        help='Maximum queued requests before answering 429')
+    parser.add_argument('--request-timeout', type=int, default=300,
+                        help='Seconds a request may spend queued and processing')
+    parser.add_argument('--max-body-mb', type=int, default=64,
+                        help='Largest request body accepted, in megabytes (larger ones get 413)')
+    parser.add_argument('--gpu', action='store_true', help='Use GPU acceleration for EasyOCR')
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help='OCR images larger than this many pixels in overlapping tiles')
+    parser.add_argument('--tile-overlap', type=int, default=200,
+                        help='Overlap between neighbouring tiles in pixels')
+    parser.add_argument('--tile-workers', type=int, default=None,
+                        help='Tiles OCR\'d in parallel per worker (defaults to CPU count / workers)')
+    parser.add_argument('--hash-index', default=None,
+                        help='SQLite file recording perceptual page hashes and OCR results')
+    parser.add_argument('--hash-reuse', action='store_true',
+                        help='Skip OCR of pages whose content matches a page in the hash index')
+    parser.add_argument('--hash-tolerance', type=float, default=1.5e-6,
+                        help='Share of a page\'s pixels that may differ from an indexed page after alignment')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # Split the cores between workers so tile threads do not oversubscribe the CPU
+    tile_workers = args.tile_workers or max(1, (os.cpu_count() or 1) // args.workers)
+
+    OCRRequestHandler.max_body_bytes = args.max_body_mb * 1024 * 1024
+    OCRRequestHandler.pool = OCRWorkerPool(workers=args.workers,
+                                           max_queue=args.max_queue,
+                                           request_timeout=args.request_timeout,
+                                           use_gpu=args.gpu,
+                                           tile_size=args.tile_size,
+                                           tile_overlap=args.tile_overlap,
+                                           tile_workers=tile_workers,
+                                           hash_index_path=args.hash_index,
+                                           hash_tolerance=args.hash_tolerance,
+                                           hash_reuse=args.hash_reuse)
+
+    server = ThreadingHTTPServer((args.host, args.port), OCRRequestHandler)
+    server.daemon_threads = True
+    logger.info(f"StealthOCR server listening on {args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
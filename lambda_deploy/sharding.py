@@ -0,0 +1,301 @@
+"""
+Page-range helpers: continuation tokens, and sharding a PDF across OCR workers
+"""
+
+import json
+import time
+import base64
+import hashlib
+import math
+import logging
+from concurrent.futures import wait
+
+logger = logging.getLogger()
+
+
+class PageRangeError(ValueError):
+    """The requested pages or continuation token do not fit the document"""
+
+
+def encode_continuation_token(pdf_sha256, first_page, last_page):
+    """
+    Build a continuation token naming the page range still to be processed
+
+    Args:
+        pdf_sha256: SHA-256 hex digest of the PDF the token belongs to
+        first_page: First page (1-based) still to be processed
+        last_page: Last page (1-based) of the requested range
+
+    Returns:
+        Opaque URL-safe token string
+    """
+    payload = json.dumps({
+        'v': 1,
+        'sha256': pdf_sha256,
+        'first_page': first_page,
+        'last_page': last_page
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_continuation_token(token):
+    """
+    Decode a continuation token produced by encode_continuation_token
+
+    Args:
+        token: Token string
+
+    Returns:
+        Dictionary with 'sha256', 'first_page' and 'last_page'
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        first_page = int(payload['first_page'])
+        last_page = int(payload['last_page'])
+        pdf_sha256 = str(payload['sha256'])
+    except Exception:
+        raise ValueError('Invalid continuation token')
+
+    if first_page < 1 or last_page < first_page:
+        raise ValueError('Invalid continuation token page range')
+
+    return {'sha256': pdf_sha256, 'first_page': first_page, 'last_page': last_page}
+
+
+def resolve_page_range(total_pages, pdf_sha256, first_page=None, last_page=None,
+                       continuation_token=None):
+    """
+    Resolve the page range a request asks for against the document
+
+    A continuation token takes precedence over first_page/last_page.
+    last_page is clamped to the document; anything else out of range is
+    an error rather than an empty result.
+
+    Args:
+        total_pages: Number of pages in the document
+        pdf_sha256: SHA-256 hex digest of the PDF
+        first_page: First page (1-based) requested (optional)
+        last_page: Last page (1-based) requested (optional)
+        continuation_token: Token from a previous partial result (optional)
+
+    Returns:
+        (first_page, last_page) tuple, 1-based and inclusive
+
+    Raises:
+        PageRangeError: If the range is empty or the token belongs to another PDF
+    """
+    if continuation_token:
+        try:
+            token = decode_continuation_token(continuation_token)
+        except ValueError as e:
+            raise PageRangeError(str(e))
+        if token['sha256'] != pdf_sha256:
+            raise PageRangeError('Continuation token does not match this PDF')
+        first_page, last_page = token['first_page'], token['last_page']
+
+    try:
+        first_page = int(first_page or 1)
+        last_page = min(int(last_page or total_pages), total_pages)
+    except (TypeError, ValueError):
+        raise PageRangeError('first_page and last_page must be integers')
+
+    if first_page < 1:
+        raise PageRangeError(f'first_page must be at least 1, got {first_page}')
+    if first_page > total_pages:
+        raise PageRangeError(f'first_page {first_page} is beyond the last page of the document ({total_pages})')
+    if first_page > last_page:
+        raise PageRangeError(f'first_page {first_page} is after last_page {last_page}')
+
+    return first_page, last_page
+
+
+def split_page_ranges(total_pages, shard_count=None, pages_per_shard=None):
+    """
+    Split a document into contiguous, ordered page ranges
+
+    Args:
+        total_pages: Number of pages in the document
+        shard_count: Desired number of shards (optional)
+        pages_per_shard: Desired pages per shard, takes precedence (optional)
+
+    Returns:
+        List of (first_page, last_page) tuples, 1-based and inclusive
+    """
+    if total_pages < 1:
+        return []
+
+    if pages_per_shard is None:
+        shard_count = max(1, min(shard_count or 1, total_pages))
+        pages_per_shard = math.ceil(total_pages / shard_count)
+    pages_per_shard = max(1, int(pages_per_shard))
+
+    return [(first, min(first + pages_per_shard - 1, total_pages))
+            for first in range(1, total_pages + 1, pages_per_shard)]
+
+
+def merge_shard_results(shard_results, engine='tesseract'):
+    """
+    Merge per-range process_pdf results into a single result, in page order
+
+    Args:
+        shard_results: List of (first_page, last_page, result) tuples
+        engine: OCR engine used by the shards
+
+    Returns:
+        Dictionary in the process_pdf result format
+    """
+    texts = []
+    pages_processed = 0
+    pages_from_hash_index = 0
+    total_pages = 0
+    pending_ranges = []
+    continuation_tokens = []
+    errors = []
+
+    for first_page, last_page, result in sorted(shard_results, key=lambda r: r[0]):
+        if not result.get('success'):
+            errors.append(f"pages {first_page}-{last_page}: {result.get('error', 'unknown error')}")
+            pending_ranges.append([first_page, last_page])
+            continue
+
+        if result.get('text'):
+            texts.append(result['text'])
+        pages_processed += result.get('pages_processed', 0)
+        pages_from_hash_index += result.get('pages_from_hash_index', 0)
+        total_pages = max(total_pages, result.get('total_pages', 0))
+
+        if not result.get('complete', True):
+            pending_ranges.append(result['next_page_range'])
+            continuation_tokens.append(result['continuation_token'])
+
+    full_text = "\n".join(texts)
+
+    merged = {
+        'success': not errors,
+        'text': full_text,
+        'engine': engine,
+        'pages_processed': pages_processed,
+        'pages_from_hash_index': pages_from_hash_index,
+        'total_pages': total_pages,
+        'shards': len(shard_results),
+        'complete': not pending_ranges,
+        'pending_page_ranges': pending_ranges,
+        'continuation_tokens': continuation_tokens,
+        'character_count': len(full_text),
+        'word_count': len(full_text.split()) if full_text else 0,
+        'line_count': len(full_text.split('\n')) if full_text else 0
+    }
+    if errors:
+        merged['error'] = '; '.join(errors)
+
+    return merged
+
+
+def run_shards(pdf_bytes, ranges, worker, executor, engine='tesseract', wait_until=None,
+               **worker_kwargs):
+    """
+    Dispatch page ranges to a worker through an executor and merge the results
+
+    Args:
+        pdf_bytes: PDF file as bytes
+        ranges: List of (first_page, last_page) tuples
+        worker: Callable(pdf_bytes, engine, first_page, last_page, **kwargs) -> result
+        executor: concurrent.futures.Executor used to run the worker
+        engine: OCR engine to use
+        wait_until: UNIX timestamp after which unfinished shards are given up
+            and reported as pending with a continuation token (optional)
+        **worker_kwargs: Extra keyword arguments passed to every worker call
+
+    Returns:
+        Merged result dictionary
+    """
+    futures = [(first_page, last_page,
+                executor.submit(worker, pdf_bytes, engine, first_page, last_page, **worker_kwargs))
+               for first_page, last_page in ranges]
+
+    timeout = None if wait_until is None else max(0, wait_until - time.time())
+    wait([future for _, _, future in futures], timeout=timeout)
+
+    pdf_sha256 = None
+    shard_results = []
+    for first_page, last_page, future in futures:
+        if not future.done():
+            future.cancel()
+            logger.warning(f"Shard {first_page}-{last_page} did not finish before the deadline")
+            pdf_sha256 = pdf_sha256 or hashlib.sha256(pdf_bytes).hexdigest()
+            result = {
+                'success': True,
+                'complete': False,
+                'next_page_range': [first_page, last_page],
+                'continuation_token': encode_continuation_token(pdf_sha256, first_page, last_page)
+            }
+        else:
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Shard {first_page}-{last_page} failed: {e}")
+                result = {'success': False, 'error': str(e)}
+        shard_results.append((first_page, last_page, result))
+
+    return merge_shard_results(shard_results, engine)
+
+
+class LambdaInvokeWorker:
+    """
+    Shard worker that processes a page range in a separate Lambda invocation
+
+    Use it with a ThreadPoolExecutor; each call blocks on a synchronous
+    invoke of the worker function. The PDF travels base64-encoded in the
+    request, so it is subject to the 6 MB synchronous payload limit.
+
+    The client is created up front, since building boto3 clients from
+    several threads at once is not thread-safe. It waits for the worker's
+    full timeout and never retries: botocore's default 60s read timeout
+    and retries would re-invoke (and re-bill) a shard that is still running.
+    """
+
+    def __init__(self, function_name, client=None, timeout=900):
+        """
+        Initialize the worker
+
+        Args:
+            function_name: Name or ARN of the worker Lambda function
+            client: boto3 Lambda client (optional, created from timeout when omitted)
+            timeout: Timeout of the worker function in seconds
+        """
+        self.function_name = function_name
+        self.client = client
+        if self.client is None:
+            import boto3
+            from botocore.config import Config
+            self.client = boto3.client('lambda', config=Config(read_timeout=timeout + 30,
+                                                               retries={'max_attempts': 0}))
+
+    def __call__(self, pdf_bytes, engine, first_page, last_page, **kwargs):
+        body = {
+            'pdf_data': base64.b64encode(pdf_bytes).decode('ascii'),
+            'first_page': first_page,
+            'last_page': last_page
+        }
+        # The worker has to return before the coordinator stops waiting for it
+        if kwargs.get('deadline') is not None:
+            body['deadline'] = kwargs['deadline']
+
+        event = {
+            'httpMethod': 'POST',
+            'body': json.dumps(body),
+            'queryStringParameters': {'engine': engine}
+        }
+
+        response = self.client.invoke(FunctionName=self.function_name,
+                                      InvocationType='RequestResponse',
+                                      Payload=json.dumps(event).encode('utf-8'))
+        payload = json.loads(response['Payload'].read())
+
+        if 'FunctionError' in response:
+            raise RuntimeError(f"Worker invocation failed: {payload}")
+
+        return json.loads(payload['body'])
@@ -0,0 +1,393 @@
+"""
+Perceptual page hashing and a persistent index of OCR results
+"""
+
+import cv2
+import numpy as np
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def dct_hash(image: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Compute a DCT-based perceptual hash of an image
+
+    The image is reduced to grayscale at 4x the hash size, and the sign of
+    each low-frequency DCT coefficient relative to their median gives one
+    bit. Small scan differences (noise, slight contrast shifts, JPEG
+    artifacts) flip few bits.
+
+    Args:
+        image: Input image as numpy array
+        hash_size: Side of the coefficient block; the hash has hash_size**2 bits
+
+    Returns:
+        Hash as a Python integer
+    """
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    side = hash_size * 4
+    small = cv2.resize(image, (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+    coeffs = cv2.dct(small)[:hash_size, :hash_size].flatten()
+
+    # The DC term only reflects overall brightness, so it is left out of the median
+    median = np.median(coeffs[1:])
+    value = 0
+    for bit in coeffs > median:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count('1')
+
+
+def content_signature(image: np.ndarray, width: int = 1700) -> np.ndarray:
+    """
+    Binarized, downscaled copy of a page used to verify hash matches
+
+    The default width is two thirds of a letter page at 300 DPI, where even
+    small print keeps distinct digit shapes, so pages that share a layout
+    but differ in their figures do not agree.
+
+    Args:
+        image: Input image as numpy array
+        width: Width of the signature in pixels; the aspect ratio is kept
+
+    Returns:
+        uint8 array with ink as 255 and background as 0
+    """
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    height = max(1, round(image.shape[0] * width / image.shape[1]))
+    small = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return ink
+
+
+def register_signature(moving: np.ndarray, fixed: np.ndarray, scale: int = 4) -> Optional[np.ndarray]:
+    """
+    Align one signature onto another, undoing the shift and skew of a rescan
+
+    The translation is estimated by phase correlation and refined together
+    with the rotation by ECC, both on blurred copies reduced by scale.
+
+    Args:
+        moving: Signature to align
+        fixed: Signature to align it to
+        scale: Reduction factor used for estimating the transform
+
+    Returns:
+        moving warped into the frame of fixed, or None if the sizes differ or
+        no alignment was found
+    """
+    if moving.shape != fixed.shape:
+        return None
+
+    def reduce(signature):
+        small = cv2.resize(signature, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small.astype(np.float32) / 255, (5, 5), 0)
+
+    small_fixed, small_moving = reduce(fixed), reduce(moving)
+    (dx, dy), _ = cv2.phaseCorrelate(small_fixed, small_moving)
+    warp = np.array([[1, 0, dx], [0, 1, dy]], dtype=np.float32)
+    try:
+        _, warp = cv2.findTransformECC(small_fixed, small_moving, warp, cv2.MOTION_EUCLIDEAN,
+                                       (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 50, 1e-4),
+                                       None, 1)
+    except cv2.error:
+        return None
+
+    warp[:, 2] *= scale
+    aligned = cv2.warpAffine(moving, warp, (fixed.shape[1], fixed.shape[0]),
+                             flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP)
+    return np.where(aligned > 127, 255, 0).astype(np.uint8)
+
+
+def content_difference(a: np.ndarray, b: np.ndarray) -> Optional[int]:
+    """
+    Number of ink pixels in either signature with no ink nearby in the other
+
+    b is first registered onto a. A one-pixel tolerance then absorbs what
+    alignment, anti-aliasing and compression leave along glyph edges, while
+    an added or changed stroke is counted in full.
+
+    Args:
+        a: Signature from content_signature
+        b: Signature from content_signature
+
+    Returns:
+        Count of unmatched ink pixels, or None if the signatures cannot be aligned
+    """
+    b = register_signature(b, a)
+    if b is None:
+        return None
+
+    kernel = np.ones((3, 3), np.uint8)
+    missing_in_b = cv2.bitwise_and(a, cv2.bitwise_not(cv2.dilate(b, kernel)))
+    missing_in_a = cv2.bitwise_and(b, cv2.bitwise_not(cv2.dilate(a, kernel)))
+    return cv2.countNonZero(missing_in_b) + cv2.countNonZero(missing_in_a)
+
+
+class PageHashes:
+    """
+    Hashes of one page, with its content signature computed on first use
+
+    The signature is only needed to confirm a hash candidate or to store the
+    page, so pages with no candidate that are not stored never pay for it.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self.phash = dct_hash(image, 8)
+        self.detail_hash = dct_hash(image, 16)
+        # Rows up to this id were already compared with the page and did not match
+        self.searched_id = 0
+        self._image = image
+        self._signature = None
+
+    @property
+    def signature(self) -> np.ndarray:
+        if self._signature is None:
+            self._signature = content_signature(self._image)
+            self._image = None
+        return self._signature
+
+
+class _BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance, for threshold lookups
+    without scanning every stored hash
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value: int, item: int):
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = (value, [item], {})
+                return
+            node = node[2][distance]
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """Return (distance, item) pairs within max_distance, nearest first"""
+        matches = []
+        stack = [self.root] if self.root is not None else []
+
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        return sorted(matches)
+
+
+class PageHashIndex:
+    """
+    Persistent index mapping perceptual page hashes to OCR results
+
+    Candidates are found with a 64-bit hash and a Hamming threshold and
+    narrowed with a 256-bit hash. The thresholds are loose enough for the
+    skew of a rescan, and both hashes come from small thumbnails, so they
+    cannot tell apart pages that share a form layout but differ in their
+    figures. A candidate is only accepted once a binarized signature of
+    its content, registered onto the new page to undo the shift and skew of
+    a rescan, differs from it in no more than a small share of the page:
+    enough for a speck of dust, not for a changed digit.
+
+    One instance is safe to share between threads. Several processes may
+    open the same file: rows they add are picked up on the next lookup.
+    SQLite serializes writers, and on network filesystems such as EFS its
+    locking is only as reliable as the NFS locks, so a failed write is
+    logged and skipped rather than failing the page.
+    """
+
+    def __init__(self,
+                 path: str,
+                 max_distance: int = 10,
+                 max_detail_distance: int = 40,
+                 max_candidates: int = 8,
+                 max_content_difference: float = 1.5e-6):
+        """
+        Open (or create) an index
+
+        Args:
+            path: SQLite database file
+            max_distance: Maximum Hamming distance between 64-bit hashes
+            max_detail_distance: Maximum Hamming distance between 256-bit hashes
+            max_candidates: Nearest hash matches whose content is compared
+            max_content_difference: Largest share of the signature's pixels that
+                may differ after alignment; the default allows about 5 pixels on a
+                letter page, a 4x4 speck at 300 DPI
+        """
+        self.path = path
+        self.max_distance = max_distance
+        self.max_detail_distance = max_detail_distance
+        self.max_candidates = max_candidates
+        self.max_content_difference = max_content_difference
+        self.lock = threading.Lock()
+
+        # Wait for other processes' writes instead of failing at once
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS page_hashes (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL,
+                phash TEXT NOT NULL,
+                detail_hash TEXT NOT NULL,
+                signature BLOB,
+                text TEXT NOT NULL
+            )
+        """)
+        # Indexes created before signatures were stored; their rows never match
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(page_hashes)")]
+        if 'signature' not in columns:
+            self.db.execute("ALTER TABLE page_hashes ADD COLUMN signature BLOB")
+        self.db.commit()
+
+        # One tree per engine/language key, since results are not interchangeable
+        self.trees: Dict[str, _BKTree] = {}
+        self.detail_hashes: Dict[int, int] = {}
+        self.last_id = 0
+        self._refresh()
+
+        logger.info(f"Loaded {len(self.detail_hashes)} page hashes from {path}")
+
+    def _refresh(self):
+        """Load rows added since the last refresh, by this or another process"""
+        for row_id, key, phash, detail_hash in self.db.execute(
+                "SELECT id, key, phash, detail_hash FROM page_hashes WHERE id > ? ORDER BY id",
+                (self.last_id,)):
+            self.trees.setdefault(key, _BKTree()).add(int(phash, 16), row_id)
+            self.detail_hashes[row_id] = int(detail_hash, 16)
+            self.last_id = row_id
+
+    @staticmethod
+    def hash_image(image: np.ndarray) -> PageHashes:
+        """Compute the hashes used by the index"""
+        return PageHashes(image)
+
+    def lookup(self, hashes: PageHashes, key: str) -> Optional[str]:
+        """
+        Find the stored OCR result of a page with the same content
+
+        Args:
+            hashes: PageHashes from hash_image
+            key: Engine/language key the result must have been produced with
+
+        Returns:
+            Stored text, or None if no stored page is close enough
+        """
+        with self.lock:
+            try:
+                self._refresh()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not refresh page hash index: {e}")
+            return self._match(hashes, key)
+
+    def _match(self, hashes: PageHashes, key: str) -> Optional[str]:
+        """
+        Compare the page with stored rows it has not been compared with yet
+
+        Called with the lock held; the lock is released while signatures are
+        aligned and taken again before returning.
+        """
+        tree = self.trees.get(key)
+        searched_id, hashes.searched_id = hashes.searched_id, self.last_id
+        if tree is None:
+            return None
+
+        candidates = []
+        for distance, row_id in tree.search(hashes.phash, self.max_distance):
+            if row_id <= searched_id:
+                continue
+            if hamming_distance(hashes.detail_hash, self.detail_hashes[row_id]) > self.max_detail_distance:
+                continue
+            stored, text = self.db.execute(
+                "SELECT signature, text FROM page_hashes WHERE id = ?", (row_id,)).fetchone()
+            if stored is not None:
+                candidates.append((distance, row_id, stored, text))
+            if len(candidates) == self.max_candidates:
+                break
+        if not candidates:
+            return None
+
+        # Alignment is the slow part, so it runs without holding the lock
+        self.lock.release()
+        try:
+            for distance, row_id, stored, text in candidates:
+                stored = cv2.imdecode(np.frombuffer(stored, np.uint8), cv2.IMREAD_GRAYSCALE)
+                difference = content_difference(stored, hashes.signature)
+                if difference is None or difference > self.max_content_difference * stored.size:
+                    logger.info(f"Page hash matched stored page {row_id} but content differs "
+                                f"({difference} pixels)")
+                    continue
+
+                logger.info(f"Page matched stored page {row_id} at distance {distance}")
+                return text
+        finally:
+            self.lock.acquire()
+
+        return None
+
+    def add(self, hashes: PageHashes, key: str, text: str) -> bool:
+        """
+        Store the OCR result of a page, unless a page with the same content is stored
+
+        Rows the page was already compared with by lookup are not compared again.
+
+        Args:
+            hashes: PageHashes from hash_image
+            key: Engine/language key the result was produced with
+            text: Extracted text
+
+        Returns:
+            True if a row was inserted
+        """
+        # A binarized page is mostly background, so PNG keeps it to a few KB
+        encoded = cv2.imencode('.png', hashes.signature)[1].tobytes()
+
+        with self.lock:
+            try:
+                # Rows added while the lock was released for alignment are compared too
+                while True:
+                    self._refresh()
+                    if hashes.searched_id == self.last_id:
+                        break
+                    if self._match(hashes, key) is not None:
+                        return False
+
+                self.db.execute(
+                    "INSERT INTO page_hashes (key, phash, detail_hash, signature, text) VALUES (?, ?, ?, ?, ?)",
+                    (key, format(hashes.phash, 'x'), format(hashes.detail_hash, 'x'), encoded, text))
+                self.db.commit()
+                # Also picks up rows other processes added before this one
+                self._refresh()
+                return True
+            except sqlite3.Error as e:
+                self.db.rollback()
+                logger.warning(f"Could not store page in hash index: {e}")
+                return False
+
+    def __len__(self) -> int:
+        return len(self.detail_hashes)
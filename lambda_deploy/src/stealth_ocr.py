@@ -8,9 +8,13 @@ import easyocr
 import numpy as np
 from PIL import Image
 import os
-from typing import List, Dict, Union, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Union, Optional, Tuple
 import logging
 
+from page_hash import PageHashIndex
+from tiling import validate_tiling, tile_origins, merge_tile_words, words_to_text
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,7 +28,15 @@ class StealthOCR:
     def __init__(self, 
                  tesseract_path: Optional[str] = None,
                  languages: List[str] = ['eng'],
-                 use_gpu: bool = False):
+                 use_gpu: bool = False,
+                 tile_size: Optional[int] = None,
+                 tile_overlap: int = 200,
+                 tile_workers: Optional[int] = None,
+                 hash_index_path: Optional[str] = None,
+                 hash_max_distance: int = 10,
+                 hash_tolerance: float = 1.5e-6,
+                 hash_reuse: bool = False,
+                 hash_index: Optional[PageHashIndex] = None):
         """
         Initialize StealthOCR
         
@@ -32,9 +44,39 @@ class StealthOCR:
             tesseract_path: Path to tesseract executable
             languages: List of languages for OCR
             use_gpu: Whether to use GPU acceleration for EasyOCR
+            tile_size: Images larger than this (in pixels, either side) are OCR'd
+                in overlapping tiles of this size; None disables tiling
+            tile_overlap: Overlap between neighbouring tiles in pixels, at most
+                half of tile_size
+            tile_workers: Number of tiles OCR'd in parallel (defaults to CPU count)
+            hash_index_path: SQLite file of perceptual page hashes and the OCR
+                result of each page
+            hash_max_distance: Maximum Hamming distance for a hash candidate
+            hash_tolerance: Largest share of a page's pixels that may differ from a
+                stored page, after aligning the two, for its result to be reused
+            hash_reuse: Return the stored result for a page whose content matches
+                instead of OCR'ing it; off by default, so the index only records
+            hash_index: Already open PageHashIndex to share between engines; takes
+                precedence over hash_index_path
+        
+        Raises:
+            ValueError: If tile_size is not positive or tile_overlap is out of range
         """
+        validate_tiling(tile_size, tile_overlap)
+        
         self.languages = languages
         self.use_gpu = use_gpu
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_workers = tile_workers
+        
+        # Perceptual hash index of previously OCR'd pages
+        self.hash_index = hash_index
+        if self.hash_index is None and hash_index_path:
+            self.hash_index = PageHashIndex(hash_index_path, max_distance=hash_max_distance,
+                                            max_content_difference=hash_tolerance)
+        self.hash_reuse = hash_reuse
+        self.hash_index_hits = 0
         
         # Set tesseract path if provided, otherwise try to find it
         if tesseract_path:
@@ -127,6 +169,9 @@ class StealthOCR:
             if isinstance(image, str):
                 image = cv2.imread(image)
             
+            if self._should_tile(image):
+                return self.extract_text_tiled(image, engine='tesseract')
+            
             # Preprocess image
             processed = self.preprocess_image(image)
             
@@ -157,6 +202,9 @@ class StealthOCR:
             if isinstance(image, str):
                 image = cv2.imread(image)
             
+            if self._should_tile(image):
+                return self.extract_text_tiled(image, engine='easyocr')
+            
             # Extract text
             results = self.easyocr_reader.readtext(image)
             
@@ -169,12 +217,107 @@ class StealthOCR:
             logger.error(f"EasyOCR failed: {e}")
             return ""
     
+    def _should_tile(self, image: np.ndarray) -> bool:
+        """Whether an image is large enough to be OCR'd in tiles"""
+        return self.tile_size is not None and max(image.shape[:2]) > self.tile_size
+    
+    def _ocr_tile_words(self, tile: np.ndarray, engine: str) -> List[Tuple[float, float, float, float, str, float]]:
+        """
+        OCR a single tile and return word boxes in tile coordinates
+        
+        Args:
+            tile: Tile image
+            engine: OCR engine to use ('tesseract' or 'easyocr')
+            
+        Returns:
+            List of (x0, y0, x1, y1, text, confidence) tuples
+        """
+        words = []
+        
+        if engine == 'tesseract':
+            processed = self.preprocess_image(tile)
+            data = pytesseract.image_to_data(processed, lang='+'.join(self.languages),
+                                             output_type=pytesseract.Output.DICT)
+            for i, text in enumerate(data['text']):
+                conf = float(data['conf'][i])
+                if text.strip() and conf >= 0:
+                    x, y = data['left'][i], data['top'][i]
+                    words.append((x, y, x + data['width'][i], y + data['height'][i], text.strip(), conf / 100))
+        else:
+            for box, text, conf in self.easyocr_reader.readtext(tile):
+                xs = [point[0] for point in box]
+                ys = [point[1] for point in box]
+                if text.strip():
+                    words.append((min(xs), min(ys), max(xs), max(ys), text.strip(), float(conf)))
+        
+        return words
+    
+    def extract_text_tiled(self, image: Union[str, np.ndarray], engine: str = 'tesseract') -> str:
+        """
+        Extract text from a large image by OCR'ing overlapping tiles in parallel
+        
+        Peak OCR memory is bounded by the tile size and the number of workers
+        rather than by the size of the whole image.
+        
+        Args:
+            image: Image path or numpy array
+            engine: OCR engine to use ('tesseract' or 'easyocr')
+            
+        Returns:
+            Extracted text
+        """
+        try:
+            engine = engine.lower()
+            if engine not in ('tesseract', 'easyocr'):
+                raise ValueError(f"Unsupported OCR engine: {engine}")
+            if engine == 'easyocr' and self.easyocr_reader is None:
+                logger.warning("EasyOCR reader not initialized")
+                return ""
+            
+            if isinstance(image, str):
+                image = cv2.imread(image)
+            
+            height, width = image.shape[:2]
+            tile_size = self.tile_size or max(height, width)
+            origins = tile_origins(height, width, self.tile_size, self.tile_overlap) if self.tile_size else [(0, 0)]
+            logger.info(f"OCR'ing {width}x{height} image in {len(origins)} tiles")
+            
+            def ocr_tile(origin: Tuple[int, int]) -> List[Tuple]:
+                x, y = origin
+                tile = image[y:y + tile_size, x:x + tile_size]
+                tile_h, tile_w = tile.shape[:2]
+                words = []
+                for x0, y0, x1, y1, text, conf in self._ocr_tile_words(tile, engine):
+                    # Distance to the nearest tile edge that is not an image border
+                    edges = [d for d, is_border in ((x0, x == 0), (y0, y == 0),
+                                                    (tile_w - x1, x + tile_w >= width),
+                                                    (tile_h - y1, y + tile_h >= height))
+                             if not is_border]
+                    words.append((x0 + x, y0 + y, x1 + x, y1 + y, text, conf,
+                                  min(edges) if edges else float('inf')))
+                return words
+            
+            with ThreadPoolExecutor(max_workers=self.tile_workers or os.cpu_count()) as executor:
+                tile_words = [w for words in executor.map(ocr_tile, origins) for w in words]
+            
+            return words_to_text(merge_tile_words(tile_words)).strip()
+        
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Tiled OCR failed: {e}")
+            return ""
+    
     def extract_text(self, 
                     image: Union[str, np.ndarray], 
                     engine: str = 'tesseract') -> str:
         """
         Extract text from image using specified engine
         
+        When a hash index is configured the result is recorded in it unless a
+        page with the same content already is, and with hash_reuse the image is first looked up there: the stored text
+        of a page with the same content is returned without running OCR.
+        
         Args:
             image: Image path or numpy array
             engine: OCR engine to use ('tesseract' or 'easyocr')
@@ -182,12 +325,33 @@ class StealthOCR:
         Returns:
             Extracted text
         """
+        if engine.lower() not in ('tesseract', 'easyocr'):
+            raise ValueError(f"Unsupported OCR engine: {engine}")
+        
+        hashes = None
+        if self.hash_index is not None:
+            if isinstance(image, str):
+                image = cv2.imread(image)
+            hashes = self.hash_index.hash_image(image)
+            text = self.hash_index.lookup(hashes, self._hash_key(engine)) if self.hash_reuse else None
+            if text is not None:
+                self.hash_index_hits += 1
+                return text
+        
         if engine.lower() == 'tesseract':
-            return self.extract_text_tesseract(image)
-        elif engine.lower() == 'easyocr':
-            return self.extract_text_easyocr(image)
+            text = self.extract_text_tesseract(image)
         else:
-            raise ValueError(f"Unsupported OCR engine: {engine}")
+            text = self.extract_text_easyocr(image)
+        
+        # Engines return "" on failure, so only real results are stored
+        if hashes is not None and text:
+            self.hash_index.add(hashes, self._hash_key(engine), text)
+        
+        return text
+    
+    def _hash_key(self, engine: str) -> str:
+        """Hash index key: stored results are only reused for the same engine and languages"""
+        return f"{engine.lower()}:{'+'.join(self.languages)}"
     
     def batch_process(self, 
                      file_paths: List[str], 
@@ -0,0 +1,134 @@
+"""
+Tile geometry for OCR'ing large images in overlapping pieces
+"""
+
+from typing import List, Optional, Tuple
+
+
+def validate_tiling(tile_size: Optional[int], tile_overlap: int):
+    """
+    Check a tile size and overlap
+
+    The overlap may be at most half the tile, so each tile advances by at
+    least half its size; a larger overlap multiplies the number of tiles
+    (an overlap equal to the tile size would advance one pixel at a time).
+
+    Args:
+        tile_size: Tile side in pixels, or None when tiling is disabled
+        tile_overlap: Overlap between neighbouring tiles in pixels
+
+    Raises:
+        ValueError: If the tile size is not positive or the overlap is out of range
+    """
+    if tile_size is None:
+        return
+    if tile_size <= 0:
+        raise ValueError(f"tile_size must be positive, got {tile_size}")
+    if not 0 <= tile_overlap <= tile_size // 2:
+        raise ValueError(f"tile_overlap must be between 0 and half of tile_size ({tile_size // 2}), "
+                         f"got {tile_overlap}")
+
+
+def tile_origins(height: int, width: int, tile_size: int, tile_overlap: int) -> List[Tuple[int, int]]:
+    """
+    Compute the top-left corners of overlapping tiles covering an image
+
+    Args:
+        height: Image height
+        width: Image width
+        tile_size: Tile side in pixels
+        tile_overlap: Overlap between neighbouring tiles in pixels
+
+    Returns:
+        List of (x, y) tile origins, row by row
+    """
+    validate_tiling(tile_size, tile_overlap)
+    stride = tile_size - tile_overlap
+
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [(x, y) for y in starts(height) for x in starts(width)]
+
+
+def box_containment(a: Tuple, b: Tuple) -> float:
+    """
+    Intersection of two (x0, y0, x1, y1, ...) boxes over the area of the smaller one
+
+    Unlike IoU this is 1.0 for a fragment cut at a tile edge lying inside
+    the complete word, however much shorter the fragment is.
+    """
+    ix = min(a[2], b[2]) - max(a[0], b[0])
+    iy = min(a[3], b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return ix * iy / smaller if smaller > 0 else 0.0
+
+
+def merge_tile_words(words: List[Tuple], overlap_threshold: float = 0.5) -> List[Tuple]:
+    """
+    De-duplicate words detected twice in tile overlaps
+
+    Words are visited from the most central in their tile outwards, and
+    larger boxes first, so a word cut by a tile edge loses to the
+    complete copy from its neighbour.
+
+    Args:
+        words: List of (x0, y0, x1, y1, text, confidence, edge_distance)
+            tuples in image coordinates
+        overlap_threshold: Minimum share of the smaller box covered by the
+            other for two words to count as duplicates
+
+    Returns:
+        List of kept (x0, y0, x1, y1, text, confidence) tuples
+    """
+    if not words:
+        return []
+
+    # Overlapping boxes always have centres in neighbouring grid cells
+    cell = max(max(w[2] - w[0], w[3] - w[1]) for w in words) or 1
+    grid = {}
+    kept = []
+
+    for word in sorted(words, key=lambda w: (-w[6], -(w[2] - w[0]) * (w[3] - w[1]), -w[5])):
+        cx = int((word[0] + word[2]) / 2 // cell)
+        cy = int((word[1] + word[3]) / 2 // cell)
+        neighbours = (other for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                      for other in grid.get((cx + dx, cy + dy), ()))
+        if any(box_containment(word, other) >= overlap_threshold for other in neighbours):
+            continue
+        grid.setdefault((cx, cy), []).append(word)
+        kept.append(word[:6])
+
+    return kept
+
+
+def words_to_text(words: List[Tuple]) -> str:
+    """
+    Reassemble word boxes into text in reading order
+
+    Args:
+        words: List of (x0, y0, x1, y1, text, ...) tuples
+
+    Returns:
+        Text with one line per detected text line
+    """
+    lines = []
+
+    for word in sorted(words, key=lambda w: (w[1] + w[3]) / 2):
+        center = (word[1] + word[3]) / 2
+        height = word[3] - word[1]
+        if lines and abs(center - lines[-1]['center']) <= max(height, lines[-1]['height']) / 2:
+            line = lines[-1]
+            line['words'].append(word)
+            line['center'] += (center - line['center']) / len(line['words'])
+        else:
+            lines.append({'center': center, 'height': height, 'words': [word]})
+
+    return '\n'.join(' '.join(w[4] for w in sorted(line['words'], key=lambda w: w[0]))
+                     for line in lines)
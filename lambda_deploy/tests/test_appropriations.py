@@ -0,0 +1,109 @@
+"""
+Tests for appropriation extraction, using the sample OCR output in the repo root
+"""
+
+import io
+import os
+import sys
+import csv
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from appropriations import CSV_COLUMNS, extract_appropriations, write_appropriations_csv
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', '..', 'extracted_text.txt')
+
+
+def load_fixture():
+    with open(FIXTURE, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_fixture_rows():
+    rows = extract_appropriations({'text': load_fixture()}, 'tranche3.pdf')
+
+    assert [(r['appropriation_category'], r['branch'], r['budget_title'], r['reprogramming_amount'])
+            for r in rows] == [
+        ('Operation and Maintenance', 'Army', '', '118600'),
+        ('Weapons Procurement', 'Navy', 'Standard Missile', '105252'),
+        ('Missile Procurement', 'Air Force', 'Sidewinder (AIM-9X)', '14500'),
+        ('Missile Procurement', 'Air Force', 'AMRAAM', '62982'),
+        ('Procurement', 'Defense-Wide', 'Aegis BMD', '356250'),
+        ('Operation and Maintenance', 'Defense-Wide', 'Israel Replacement Transfer Fund', '-657584'),
+    ]
+
+    last = rows[-1]
+    assert last['fiscal_year_start'] == '2024'
+    assert last['fiscal_year_end'] == '2025'
+    assert last['budget_activity_number'] == '4'
+    assert last['program_base_congressional'] == '4400000'
+    assert last['program_base_dod'] == '3175117'
+    assert last['revised_program_total'] == '2917533'
+    assert all(r['file'] == 'tranche3.pdf' for r in rows)
+
+
+def test_explanation_stops_at_blank_line():
+    rows = extract_appropriations(load_fixture())
+
+    assert rows[0]['explanation'].endswith('This is an emergency budget requirement.')
+    assert 'Approved' not in rows[0]['explanation']
+
+
+def page_break(text):
+    """The fixture's own footer, page marker and running header between pages 1 and 2"""
+    start = text.index('DD 1415-3 UNCLASSIFIED')
+    end = text.index('Approved by Sec Def', start) + len('Approved by Sec Def')
+    return text[start:end]
+
+
+@pytest.mark.parametrize('before, after', [('\n', '\n\n'), ('\n\n', '\n')])
+def test_explanation_continues_across_page_break(before, after):
+    text = load_fixture()
+    split = text.replace('deployment of air defense materiel,',
+                         f'deployment of{before}{page_break(text)}{after}air defense materiel,')
+    assert split != text
+
+    expected = extract_appropriations(text)
+    rows = extract_appropriations(split)
+
+    assert rows[0]['explanation'] == expected[0]['explanation']
+    assert 'deployment of air defense materiel' in rows[0]['explanation']
+    assert 'UNCLASSIFIED' not in rows[0]['explanation']
+    assert rows == expected
+
+
+def test_explanation_ending_at_page_end_is_not_extended():
+    rows = extract_appropriations(load_fixture())
+
+    # Page 2 ends with the Aegis explanation; page 3 opens a new section
+    assert rows[4]['explanation'].endswith('This is an emergency budget requirement.')
+    assert 'Subject' not in rows[4]['explanation']
+
+
+def test_pem_is_extracted():
+    text = "\n".join([
+        "AIR FORCE INCREASE +30,000",
+        "Research, Development, Test and Evaluation, Air Force, 24/25 +30,000",
+        "Budget Activity 04: Advanced Component Development and Prototypes",
+        "0604858F Tech Transition Program",
+        "239,026 239,026 +30,000 269,026",
+    ])
+
+    row, = extract_appropriations(text)
+
+    assert row['pem'] == '0604858F'
+    assert row['budget_title'] == 'Tech Transition Program'
+    assert row['appropriation_category'] == 'Research, Development, Test and Evaluation'
+
+
+def test_write_csv_streams_all_documents():
+    output = io.StringIO()
+    count = write_appropriations_csv([('a.txt', load_fixture()), ('b.txt', load_fixture())], output)
+
+    output.seek(0)
+    rows = list(csv.DictReader(output))
+    assert count == len(rows) == 12
+    assert list(rows[0]) == CSV_COLUMNS
+    assert {r['file'] for r in rows} == {'a.txt', 'b.txt'}
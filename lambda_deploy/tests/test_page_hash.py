@@ -0,0 +1,136 @@
+"""
+Tests for the perceptual page hash index
+"""
+
+import os
+import sys
+
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from page_hash import PageHashIndex, hamming_distance
+
+KEY = 'tesseract:eng'
+
+
+def form_page(amount):
+    """A letter page at 300 DPI: a ruled table whose rows differ only in their figures"""
+    image = np.full((3300, 2550), 255, np.uint8)
+    for y in range(300, 3000, 150):
+        cv2.line(image, (150, y), (2400, y), 0, 3)
+    for x in (150, 1200, 1600, 2000, 2400):
+        cv2.line(image, (x, 300), (x, 2850), 0, 3)
+    cv2.putText(image, 'REPROGRAMMING ACTION', (200, 200), cv2.FONT_HERSHEY_SIMPLEX, 2, 0, 4)
+    for i, y in enumerate(range(400, 2900, 150)):
+        cv2.putText(image, f'Line item {i}', (200, y), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 3)
+        cv2.putText(image, amount if i == 5 else '100,000', (1620, y), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 3)
+    return image
+
+
+@pytest.fixture
+def index(tmp_path):
+    return PageHashIndex(str(tmp_path / 'hashes.db'))
+
+
+def test_same_layout_different_figures_is_not_reused(index):
+    original, changed = form_page('2,911,533'), form_page('2,917,533')
+    original_hashes = index.hash_image(original)
+    changed_hashes = index.hash_image(changed)
+
+    # The thumbnail hashes alone cannot tell the pages apart
+    assert hamming_distance(original_hashes.phash, changed_hashes.phash) <= index.max_distance
+    assert hamming_distance(original_hashes.detail_hash, changed_hashes.detail_hash) <= index.max_detail_distance
+
+    index.add(original_hashes, KEY, 'revised 2,911,533')
+
+    assert index.lookup(changed_hashes, KEY) is None
+
+
+def test_same_page_is_reused(index):
+    page = form_page('2,911,533')
+    index.add(index.hash_image(page), KEY, 'revised 2,911,533')
+
+    # Re-encoding noise does not prevent a match
+    recompressed = cv2.imdecode(cv2.imencode('.jpg', page, [cv2.IMWRITE_JPEG_QUALITY, 85])[1],
+                                cv2.IMREAD_GRAYSCALE)
+
+    assert index.lookup(index.hash_image(page), KEY) == 'revised 2,911,533'
+    assert index.lookup(index.hash_image(recompressed), KEY) == 'revised 2,911,533'
+    assert index.lookup(index.hash_image(page), 'easyocr:en') is None
+
+
+def rescan(page, dx=0, dy=0, angle=0.0):
+    """The page fed through a scanner again: shifted and rotated about its centre"""
+    height, width = page.shape
+    warp = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    warp[:, 2] += (dx, dy)
+    return cv2.warpAffine(page, warp, (width, height), borderValue=255)
+
+
+@pytest.mark.parametrize('dx, dy, angle', [(2, 2, 0.0), (15, -10, 0.0), (0, 0, 0.3), (6, 4, 1.0)])
+def test_rescanned_page_is_reused(index, dx, dy, angle):
+    index.add(index.hash_image(form_page('2,911,533')), KEY, 'revised 2,911,533')
+
+    copy = rescan(form_page('2,911,533'), dx, dy, angle)
+    assert index.lookup(index.hash_image(copy), KEY) == 'revised 2,911,533'
+
+    # Alignment does not absorb a changed figure on a rescanned copy either
+    changed = rescan(form_page('2,917,533'), dx, dy, angle)
+    assert index.lookup(index.hash_image(changed), KEY) is None
+
+
+def test_speck_of_dust_is_tolerated(index):
+    index.add(index.hash_image(form_page('2,911,533')), KEY, 'revised 2,911,533')
+
+    dusty = form_page('2,911,533')
+    dusty[1800:1804, 700:704] = 0
+
+    assert index.lookup(index.hash_image(dusty), KEY) == 'revised 2,911,533'
+
+
+def test_same_page_is_stored_once(index):
+    page = form_page('2,911,533')
+
+    assert index.add(index.hash_image(page), KEY, 'first')
+    assert not index.add(index.hash_image(rescan(page, 3, 3)), KEY, 'second')
+    assert index.add(index.hash_image(form_page('2,917,533')), KEY, 'changed')
+
+    assert len(index) == 2
+    assert index.lookup(index.hash_image(page), KEY) == 'first'
+
+
+def test_signature_is_only_computed_when_needed(index):
+    hashes = index.hash_image(form_page('2,911,533'))
+
+    # Nothing stored under the key, so there is no candidate to verify
+    assert index.lookup(hashes, KEY) is None
+    assert hashes._signature is None
+
+    index.add(hashes, KEY, 'stored')
+    assert hashes._signature is not None
+
+
+def test_index_persists(tmp_path):
+    path = str(tmp_path / 'hashes.db')
+    page = form_page('2,911,533')
+    PageHashIndex(path).add(PageHashIndex.hash_image(page), KEY, 'stored')
+
+    reopened = PageHashIndex(path)
+
+    assert len(reopened) == 1
+    assert reopened.lookup(reopened.hash_image(page), KEY) == 'stored'
+
+
+def test_rows_added_by_another_process_are_found(tmp_path):
+    path = str(tmp_path / 'hashes.db')
+    page = form_page('2,911,533')
+    reader, writer = PageHashIndex(path), PageHashIndex(path)
+
+    writer.add(writer.hash_image(page), KEY, 'stored elsewhere')
+
+    assert reader.lookup(reader.hash_image(page), KEY) == 'stored elsewhere'
+    assert len(reader) == 1
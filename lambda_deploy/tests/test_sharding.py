@@ -0,0 +1,149 @@
+"""
+Tests for continuation tokens and page-range sharding
+"""
+
+import io
+import base64
+import json
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sharding import (LambdaInvokeWorker, PageRangeError, decode_continuation_token,
+                      encode_continuation_token, merge_shard_results, resolve_page_range,
+                      run_shards, split_page_ranges)
+
+SHA = 'a' * 64
+OTHER_SHA = 'b' * 64
+
+
+def test_token_round_trip():
+    token = encode_continuation_token(SHA, 4, 9)
+
+    assert decode_continuation_token(token) == {'sha256': SHA, 'first_page': 4, 'last_page': 9}
+    assert resolve_page_range(12, SHA, continuation_token=token) == (4, 9)
+
+
+@pytest.mark.parametrize('token', [
+    'not a token',
+    base64.urlsafe_b64encode(b'{"v":1}').decode('ascii'),
+    base64.urlsafe_b64encode(json.dumps({'v': 1, 'sha256': SHA, 'first_page': 5,
+                                         'last_page': 2}).encode()).decode('ascii'),
+])
+def test_tampered_token_is_rejected(token):
+    with pytest.raises(ValueError):
+        decode_continuation_token(token)
+    with pytest.raises(PageRangeError):
+        resolve_page_range(12, SHA, continuation_token=token)
+
+
+def test_token_for_another_pdf_is_rejected():
+    token = encode_continuation_token(OTHER_SHA, 4, 9)
+
+    with pytest.raises(PageRangeError, match='does not match'):
+        resolve_page_range(12, SHA, continuation_token=token)
+
+
+def test_page_range_defaults_and_clamping():
+    assert resolve_page_range(12, SHA) == (1, 12)
+    assert resolve_page_range(12, SHA, first_page=3) == (3, 12)
+    assert resolve_page_range(12, SHA, first_page=3, last_page=40) == (3, 12)
+
+
+@pytest.mark.parametrize('first_page, last_page', [(13, None), (10, 9), (-1, 4), ('x', None)])
+def test_empty_or_invalid_page_range_is_rejected(first_page, last_page):
+    with pytest.raises(PageRangeError):
+        resolve_page_range(12, SHA, first_page=first_page, last_page=last_page)
+
+
+def test_split_page_ranges():
+    assert split_page_ranges(0) == []
+    assert split_page_ranges(7, pages_per_shard=3) == [(1, 3), (4, 6), (7, 7)]
+    assert split_page_ranges(7, shard_count=2) == [(1, 4), (5, 7)]
+    assert split_page_ranges(3, shard_count=10) == [(1, 1), (2, 2), (3, 3)]
+
+
+def test_split_page_ranges_covers_every_page_once():
+    ranges = split_page_ranges(101, pages_per_shard=7)
+    pages = [page for first, last in ranges for page in range(first, last + 1)]
+
+    assert pages == list(range(1, 102))
+
+
+def shard_result(first_page, last_page, **extra):
+    return {'success': True, 'text': f'=== PAGE {first_page} ===', 'total_pages': 9,
+            'pages_processed': last_page - first_page + 1, 'complete': True, **extra}
+
+
+def test_merge_restores_page_order():
+    merged = merge_shard_results([
+        (7, 9, shard_result(7, 9)),
+        (1, 3, shard_result(1, 3, pages_from_hash_index=2)),
+        (4, 6, shard_result(4, 6)),
+    ])
+
+    assert merged['success'] and merged['complete']
+    assert merged['text'] == '=== PAGE 1 ===\n=== PAGE 4 ===\n=== PAGE 7 ==='
+    assert merged['pages_processed'] == 9
+    assert merged['pages_from_hash_index'] == 2
+    assert merged['shards'] == 3
+
+
+def test_merge_reports_pending_and_failed_shards():
+    token = encode_continuation_token(SHA, 6, 6)
+    merged = merge_shard_results([
+        (4, 6, shard_result(4, 5, complete=False, next_page_range=[6, 6], continuation_token=token)),
+        (1, 3, {'success': False, 'error': 'boom'}),
+    ])
+
+    assert not merged['success'] and not merged['complete']
+    assert merged['pending_page_ranges'] == [[1, 3], [6, 6]]
+    assert merged['continuation_tokens'] == [token]
+    assert 'pages 1-3: boom' in merged['error']
+
+
+def test_shards_past_the_deadline_are_returned_as_pending():
+    release = threading.Event()
+
+    def worker(pdf_bytes, engine, first_page, last_page, **kwargs):
+        if first_page > 1:
+            release.wait(5)
+        return shard_result(first_page, last_page)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        merged = run_shards(b'%PDF', [(1, 3), (4, 6)], worker, executor, wait_until=time.time() + 0.2)
+        release.set()
+
+    assert merged['success'] and not merged['complete']
+    assert merged['pages_processed'] == 3
+    assert merged['pending_page_ranges'] == [[4, 6]]
+    token, = merged['continuation_tokens']
+    assert decode_continuation_token(token)['first_page'] == 4
+
+
+class FakeLambdaClient:
+    def __init__(self):
+        self.events = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.events.append(json.loads(Payload))
+        body = json.dumps(shard_result(1, 3))
+        return {'Payload': io.BytesIO(json.dumps({'statusCode': 200, 'body': body}).encode())}
+
+
+def test_lambda_worker_forwards_deadline():
+    client = FakeLambdaClient()
+    worker = LambdaInvokeWorker('ocr-worker', client=client)
+
+    result = worker(b'%PDF', 'tesseract', 1, 3, deadline=1234.5)
+
+    assert result['success']
+    body = json.loads(client.events[0]['body'])
+    assert (body['first_page'], body['last_page'], body['deadline']) == (1, 3, 1234.5)
+    assert base64.b64decode(body['pdf_data']) == b'%PDF'
@@ -0,0 +1,80 @@
+"""
+Tests for the tile geometry used by tiled OCR
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tiling import box_containment, merge_tile_words, tile_origins, validate_tiling, words_to_text
+
+
+def test_small_image_is_one_tile():
+    assert tile_origins(500, 400, 1000, 200) == [(0, 0)]
+
+
+def test_tiles_cover_the_image_and_overlap():
+    origins = tile_origins(2500, 1800, 1000, 200)
+
+    xs = sorted({x for x, _ in origins})
+    ys = sorted({y for _, y in origins})
+    assert xs == [0, 800]
+    assert ys == [0, 800, 1500]
+    assert len(origins) == len(xs) * len(ys)
+    # The last tile ends flush with the image
+    assert xs[-1] + 1000 == 1800 and ys[-1] + 1000 == 2500
+
+
+@pytest.mark.parametrize('tile_size, tile_overlap', [(200, 200), (200, 101), (200, -1), (0, 0)])
+def test_invalid_tiling_is_rejected(tile_size, tile_overlap):
+    with pytest.raises(ValueError):
+        validate_tiling(tile_size, tile_overlap)
+    with pytest.raises(ValueError):
+        tile_origins(3300, 2550, tile_size, tile_overlap)
+
+
+def test_tiling_disabled_needs_no_overlap_check():
+    validate_tiling(None, 200)
+
+
+def test_box_containment():
+    word = (100, 10, 300, 40)
+    assert box_containment(word, (100, 10, 160, 40)) == 1.0
+    assert box_containment(word, (250, 10, 350, 40)) == 0.5
+    assert box_containment(word, (400, 10, 500, 40)) == 0.0
+
+
+def test_fragment_at_tile_edge_loses_to_whole_word():
+    # "Appropriation" cut by the right edge of one tile, complete in the next
+    fragment = (1900, 500, 1995, 540, 'Approp', 0.9, 5)
+    whole = (1900, 500, 2160, 540, 'Appropriation', 0.8, 100)
+    title = (2180, 500, 2290, 540, 'Title', 0.9, 120)
+
+    kept = merge_tile_words([fragment, whole, title])
+
+    assert words_to_text(kept) == 'Appropriation Title'
+    assert all(len(w) == 6 for w in kept)
+
+
+def test_duplicate_in_overlap_is_kept_once():
+    left = (810, 300, 900, 330, 'Budget', 0.95, 90)
+    right = (811, 301, 900, 331, 'Budget', 0.90, 11)
+
+    kept = merge_tile_words([right, left])
+
+    assert kept == [left[:6]]
+
+
+def test_words_to_text_reading_order():
+    words = [
+        (300, 102, 380, 128, 'Activity', 0.9),
+        (100, 200, 180, 230, 'Operating', 0.9),
+        (10, 100, 100, 130, 'Budget', 0.9),
+        (200, 205, 260, 228, 'Forces', 0.9),
+    ]
+
+    assert words_to_text(words) == 'Budget Activity\nOperating Forces'
+    assert words_to_text([]) == ''